@@ -1,16 +1,85 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import sqlite3
+import threading
 from datetime import datetime
-import math
 
 DB_FILE = "seo_dashboard.db"
 
+# Columns written by save_data, in schema order
+TABLE_COLUMNS = {
+    "queries": ["keyword", "month", "Clicks", "Impressions", "CTR", "Position"],
+    "pages": ["url", "month", "Clicks", "Impressions", "CTR", "Position"],
+}
+UPLOAD_COLUMNS = {"Top queries", "Top pages", "Clicks", "Impressions", "CTR", "Position"}
+
+def table_columns(table):
+    # Table names get interpolated into SQL, so only the known data tables are accepted
+    if table not in TABLE_COLUMNS:
+        raise ValueError(f"Unknown table: {table!r}")
+    return TABLE_COLUMNS[table]
+
 # ----------------------
 # Database Setup
 # ----------------------
+def connect():
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-64000")  # ~64 MB page cache
+    conn.execute("PRAGMA mmap_size=268435456")  # reads of the first 256 MB go through the OS page cache directly
+    return conn
+
+@st.cache_resource
+def get_conn():
+    # One long-lived write connection per process keeps SQLite's page cache warm across reruns
+    conn = connect()
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+@st.cache_resource
+def get_write_lock():
+    # Sessions run on separate threads but share the connection, so their transactions must not interleave
+    return threading.Lock()
+
+@st.cache_resource
+def get_read_conn():
+    # A second long-lived connection, for reads only. Under WAL it only ever sees committed rows,
+    # and the rollback read_sql issues after a failed query cannot undo a write in progress.
+    return connect()
+
+@st.cache_resource
+def get_read_lock():
+    # Sessions share the read connection as well, so their queries take turns on it
+    return threading.Lock()
+
+def ensure_unique(cursor, table, columns):
+    index_name = f"uq_{table}_{'_'.join(columns)}"
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index_name,)).fetchone():
+        return
+    # Older databases may hold duplicates from repeated saves; keep the most recent row of each
+    cols = ", ".join(columns)
+    cursor.execute(f"""
+        DELETE FROM {table} WHERE rowid NOT IN (
+            SELECT MAX(rowid) FROM {table} GROUP BY {cols}
+        )
+    """)
+    cursor.execute(f"CREATE UNIQUE INDEX {index_name} ON {table}({cols})")
+
+def ensure_month_key(cursor, table):
+    if "month_key" in [r[1] for r in cursor.execute(f"PRAGMA table_info({table})")]:
+        return
+    # Tables created before month_key existed: add it and backfill from the stored labels
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN month_key INTEGER")
+    months = [r[0] for r in cursor.execute(f"SELECT DISTINCT month FROM {table}")]
+    cursor.executemany(f"UPDATE {table} SET month_key = ? WHERE month = ?",
+                       [(month_sort_key(m), m) for m in months])
+
+@st.cache_resource
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
+    # Cached so schema setup runs once per process, and never from two sessions at once
+    conn = get_conn()
     cursor = conn.cursor()
 
     cursor.execute("""
@@ -20,7 +89,8 @@ def init_db():
             Clicks INTEGER,
             Impressions INTEGER,
             CTR REAL,
-            Position REAL
+            Position REAL,
+            month_key INTEGER
         )
     """)
     cursor.execute("""
@@ -30,7 +100,8 @@ def init_db():
             Clicks INTEGER,
             Impressions INTEGER,
             CTR REAL,
-            Position REAL
+            Position REAL,
+            month_key INTEGER
         )
     """)
     cursor.execute("""
@@ -47,110 +118,206 @@ def init_db():
         )
     """)
 
+    ensure_month_key(cursor, "queries")
+    ensure_month_key(cursor, "pages")
+    ensure_unique(cursor, "queries", ["keyword", "month"])
+    ensure_unique(cursor, "pages", ["url", "month"])
+    ensure_unique(cursor, "keyword_page_map", ["keyword", "url"])
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_queries_month ON queries(month)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pages_month ON pages(month)")
+    # get_notes filters on keyword and orders by date DESC, rowid DESC; walking this
+    # ascending index backwards yields exactly that order, with no sort step
+    cursor.execute("DROP INDEX IF EXISTS idx_notes_keyword")
+    cursor.execute("DROP INDEX IF EXISTS idx_notes_keyword_date")  # the old DESC variant
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notes_by_keyword_date ON notes(keyword, date)")
+    cursor.execute("DROP INDEX IF EXISTS idx_map_keyword")  # covered by the unique (keyword, url) index
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_map_url ON keyword_page_map(url)")
+
     conn.commit()
-    conn.close()
+    # Refresh planner statistics where they are stale; cheap when nothing changed
+    cursor.execute("PRAGMA optimize")
 
 # ----------------------
 # Save / Load Data
 # ----------------------
 def clean_and_prepare_df(df):
     df.columns = df.columns.str.strip()
-    if "CTR" in df.columns:
-        df["CTR"] = df["CTR"].astype(str).str.replace("%", "", regex=False)
-        df["CTR"] = pd.to_numeric(df["CTR"], errors="coerce")
+    # Only text CTR values ("1.23%") need stripping; numeric columns skip the string round-trip
+    if "CTR" in df.columns and not pd.api.types.is_numeric_dtype(df["CTR"]):
+        df["CTR"] = pd.to_numeric(df["CTR"].str.rstrip("%"), errors="coerce")
     return df
 
+def month_sort_key(label):
+    # "Jul 2025" -> 202507 so months sort chronologically; custom labels that don't parse get None
+    for fmt in ("%b %Y", "%B %Y"):
+        try:
+            parsed = datetime.strptime(str(label).strip(), fmt)
+        except ValueError:
+            continue
+        return parsed.year * 100 + parsed.month
+    return None
+
 def save_data(df, table, month):
-    conn = sqlite3.connect(DB_FILE)
-    df = clean_and_prepare_df(df.copy())
-    df["month"] = month
+    conn = get_conn()
+    # assign() hands back a new frame, so the caller's DataFrame is left untouched without a deep copy
+    df = clean_and_prepare_df(df.assign(month=month, month_key=month_sort_key(month)))
     for col in ["Clicks", "Impressions", "CTR", "Position"]:
-        if col in df.columns:
-            if col in ["Clicks", "Impressions"]:
-                df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype(int)
-            else:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-    df.to_sql(table, conn, if_exists="append", index=False)
-    conn.close()
-
-def load_data(table):
-    conn = sqlite3.connect(DB_FILE)
+        # read_csv already parses clean numeric columns natively; only text needs coercing.
+        # Missing values stay NaN, which SQLite stores as NULL rather than a fake 0.
+        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    # Insert only the schema's columns through one prepared statement, in a single transaction.
+    # Re-uploading a month overwrites its rows instead of appending duplicates.
+    key_col = table_columns(table)[0]
+    cols = [c for c in table_columns(table) + ["month_key"] if c in df.columns]
+    updates = ", ".join(f"{c} = excluded.{c}" for c in cols if c not in (key_col, "month"))
+    sql = (f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+           f"ON CONFLICT({key_col}, month) DO " + (f"UPDATE SET {updates}" if updates else "NOTHING"))
     try:
-        df = pd.read_sql(f"SELECT * FROM {table}", conn)
-    except Exception:
-        df = pd.DataFrame()
-    conn.close()
-    return df
+        with get_write_lock(), conn:
+            conn.executemany(sql, df[cols].itertuples(index=False, name=None))
+    finally:
+        # Clear even when the write fails, so no cached read outlives a rolled-back transaction
+        get_months.clear()
+        get_keys.clear()
+        get_history.clear()
+        compare_months.clear()
+
+def read_upload_preview(file, nrows=5):
+    # Only the columns save_data can store are parsed; GSC exports may carry extras.
+    # Rewind first, since the same upload is read once for the preview and again on save.
+    file.seek(0)
+    return pd.read_csv(file, usecols=lambda c: c.strip() in UPLOAD_COLUMNS, nrows=nrows)
+
+def read_uploaded_csv(file, columns):
+    # Full parse on save with pyarrow's multithreaded reader; it needs the column list
+    # up front (from the preview), since it takes neither a callable usecols nor nrows
+    file.seek(0)
+    try:
+        return pd.read_csv(file, engine="pyarrow", usecols=columns)
+    except (ImportError, pd.errors.ParserError):
+        # pyarrow missing, or stricter than the C parser (e.g. short rows); re-read with the C engine
+        file.seek(0)
+        return pd.read_csv(file, usecols=columns, low_memory=False)
+
+def has_rows(table):
+    table_columns(table)
+    conn = get_read_conn()
+    with get_read_lock():
+        return conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is not None
+
+@st.cache_data(show_spinner=False)
+def get_history(table, value):
+    # Filter and sort in SQL so the explorers only pull the selected keyword's or page's rows
+    key_col = table_columns(table)[0]
+    conn = get_read_conn()
+    with get_read_lock():
+        return pd.read_sql(f"SELECT {', '.join(table_columns(table))} FROM {table} WHERE {key_col} = ? "
+                           "ORDER BY month_key IS NULL, month_key, month",
+                           conn, params=(value,))
+
+@st.cache_data(show_spinner=False)
+def get_months(table):
+    # Chronological via month_key; labels that don't parse as "Mon YYYY" sort last, alphabetically
+    table_columns(table)
+    conn = get_read_conn()
+    with get_read_lock():
+        return [r[0] for r in conn.execute(f"""
+            SELECT month FROM {table} WHERE month IS NOT NULL
+            GROUP BY month ORDER BY MIN(month_key) IS NULL, MIN(month_key), month
+        """)]
+
+@st.cache_data(show_spinner=False)
+def get_keys(table):
+    # Distinct keywords or URLs, sorted by SQLite off the (key, month) index
+    key_col = table_columns(table)[0]
+    conn = get_read_conn()
+    with get_read_lock():
+        return [r[0] for r in conn.execute(f"SELECT DISTINCT {key_col} FROM {table} WHERE {key_col} IS NOT NULL ORDER BY {key_col}")]
 
 # ----------------------
 # Notes Handling
 # ----------------------
+def add_notes(rows):
+    # (keyword, date, note) rows go in one transaction, so a bulk import costs a single commit
+    conn = get_conn()
+    try:
+        with get_write_lock(), conn:
+            conn.executemany("INSERT INTO notes (keyword, date, note) VALUES (?, ?, ?)", rows)
+    finally:
+        get_notes.clear()
+
 def add_note(keyword, note):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO notes (keyword, date, note) VALUES (?, ?, ?)",
-                   (keyword, datetime.now().strftime("%Y-%m-%d"), note))
-    conn.commit()
-    conn.close()
+    add_notes([(keyword, datetime.now().strftime("%Y-%m-%d"), note)])
 
+@st.cache_data(show_spinner=False)
 def get_notes(keyword):
-    conn = sqlite3.connect(DB_FILE)
-    df = pd.read_sql("SELECT * FROM notes WHERE keyword = ? ORDER BY date DESC", conn, params=(keyword,))
-    conn.close()
-    return df
+    # Newest first; rowid breaks ties between notes saved on the same day
+    conn = get_read_conn()
+    with get_read_lock():
+        return pd.read_sql("SELECT * FROM notes WHERE keyword = ? ORDER BY date DESC, rowid DESC", conn, params=(keyword,))
 
 # ----------------------
 # Mapping Handling
 # ----------------------
-def add_mapping(keyword, url):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO keyword_page_map (keyword, url) VALUES (?, ?)", (keyword, url))
-    conn.commit()
-    conn.close()
+def add_mappings(pairs):
+    # All (keyword, url) pairs go in one transaction, so a multi-select save costs a single commit.
+    # Pairs that are already linked are skipped.
+    conn = get_conn()
+    try:
+        with get_write_lock(), conn:
+            conn.executemany("INSERT OR IGNORE INTO keyword_page_map (keyword, url) VALUES (?, ?)", pairs)
+    finally:
+        get_pages_for_keyword.clear()
+        get_keywords_for_page.clear()
 
+@st.cache_data(show_spinner=False)
 def get_pages_for_keyword(keyword):
-    conn = sqlite3.connect(DB_FILE)
-    df = pd.read_sql("SELECT url FROM keyword_page_map WHERE keyword = ?", conn, params=(keyword,))
-    conn.close()
-    return df
+    # Single-column lookups skip read_sql's DataFrame construction; callers wrap the list for display
+    conn = get_read_conn()
+    with get_read_lock():
+        return [r[0] for r in conn.execute("SELECT url FROM keyword_page_map WHERE keyword = ?", (keyword,))]
 
+@st.cache_data(show_spinner=False)
 def get_keywords_for_page(url):
-    conn = sqlite3.connect(DB_FILE)
-    df = pd.read_sql("SELECT keyword FROM keyword_page_map WHERE url = ?", conn, params=(url,))
-    conn.close()
-    return df
+    conn = get_read_conn()
+    with get_read_lock():
+        return [r[0] for r in conn.execute("SELECT keyword FROM keyword_page_map WHERE url = ?", (url,))]
 
 # ----------------------
 # Comparison helpers
 # ----------------------
-def aggregate_metrics(df, filter_col, filter_val, month):
-    subset = df[(df[filter_col] == filter_val) & (df["month"] == month)]
-    if subset.empty:
+@st.cache_data(show_spinner=False)
+def compare_months(table, value, m1, m2):
+    # One grouped query fetches both months; the pivot and the Change column are vectorized
+    key_col = table_columns(table)[0]
+    conn = get_read_conn()
+    with get_read_lock():
+        totals = pd.read_sql(f"""
+            SELECT month,
+                   COALESCE(SUM(Clicks), 0) AS Clicks,
+                   COALESCE(SUM(Impressions), 0) AS Impressions,
+                   AVG(Position) AS Position
+            FROM {table}
+            WHERE {key_col} = ? AND month IN (?, ?)
+            GROUP BY month
+        """, conn, params=(value, m1, m2),
+            # AVG over all-NULL positions comes back as None; force floats so that reads as NaN
+            dtype={"Clicks": float, "Impressions": float, "Position": float}).set_index("month")
+    if len(totals) < 2:
         return None
 
-    clicks = subset["Clicks"].sum() if "Clicks" in subset.columns else 0
-    impressions = subset["Impressions"].sum() if "Impressions" in subset.columns else 0
-    ctr = (clicks / impressions * 100) if impressions > 0 else float("nan")
-    position = subset["Position"].dropna()
-    position_val = position.mean() if not position.empty else float("nan")
-    return {
-        "Clicks": int(clicks),
-        "Impressions": int(impressions),
-        "CTR": round(ctr, 2) if not math.isnan(ctr) else float("nan"),
-        "Position": round(position_val, 2) if not math.isnan(position_val) else float("nan")
-    }
-
-def color_change(val):
-    try:
-        v = float(val)
-    except Exception:
-        return ""
-    if v > 0:
-        return "color: green; font-weight: bold;"
-    elif v < 0:
-        return "color: red; font-weight: bold;"
-    return ""
+    impressions = totals["Impressions"].where(totals["Impressions"] > 0)
+    totals["CTR"] = (totals["Clicks"] / impressions * 100).round(2)
+    totals["Position"] = totals["Position"].round(2)
+    comp = totals.loc[[m1, m2], ["Clicks", "Impressions", "CTR", "Position"]].T
+    comp["Change"] = comp[m2] - comp[m1]
+    return comp.rename_axis("Metric").reset_index()
+
+def style_change(col):
+    # Whole-column styling in one vectorized pass; NaN compares false and stays unstyled
+    return np.where(col > 0, "color: green; font-weight: bold;",
+                    np.where(col < 0, "color: red; font-weight: bold;", ""))
 
 # ----------------------
 # Streamlit App
@@ -173,22 +340,26 @@ def main():
     month = st.text_input("Or enter custom month label", value=month_choice)
 
     if uploaded_file is not None:
-        df = pd.read_csv(uploaded_file)
+        # Reruns only parse the preview rows; the full file is read when it is actually saved
+        preview = read_upload_preview(uploaded_file)
         st.write("Preview of uploaded file:")
-        st.dataframe(df.head(), use_container_width=True)
+        st.dataframe(preview, use_container_width=True)
 
         if st.button("Save to Database"):
-            if "Top queries" in df.columns:
+            if "Top queries" in preview.columns:
+                df = read_uploaded_csv(uploaded_file, list(preview.columns))
                 save_data(df.rename(columns={"Top queries": "keyword"}), "queries", month)
                 st.success("Queries saved.")
-            elif "Top pages" in df.columns:
+            elif "Top pages" in preview.columns:
+                df = read_uploaded_csv(uploaded_file, list(preview.columns))
                 save_data(df.rename(columns={"Top pages": "url"}), "pages", month)
                 st.success("Pages saved.")
             else:
                 st.error("CSV must contain 'Top queries' or 'Top pages'.")
 
-    queries_df = load_data("queries")
-    pages_df = load_data("pages")
+    # The sections below query what they need; here we only need to know which tables have data
+    has_queries = has_rows("queries")
+    has_pages = has_rows("pages")
 
     col1, col2 = st.columns(2)
 
@@ -197,28 +368,27 @@ def main():
     # ----------------------
     with col1:
         st.subheader("🔑 Keyword Explorer")
-        if queries_df.empty:
+        if not has_queries:
             st.info("Upload Queries CSV to see keywords.")
         else:
             kw_input = st.text_input("Type or paste keyword", "")
             keyword = kw_input.strip() if kw_input.strip() else None
 
-            if keyword and keyword in queries_df["keyword"].values:
-                history = queries_df[queries_df["keyword"] == keyword].sort_values("month")
+            history = get_history("queries", keyword) if keyword else pd.DataFrame()
+            if not history.empty:
                 st.write("📈 Performance History")
                 st.dataframe(history, use_container_width=True)
 
                 st.write("🔗 Linked Pages")
                 linked_pages = get_pages_for_keyword(keyword)
-                if not linked_pages.empty:
-                    st.dataframe(linked_pages, use_container_width=True)
+                if linked_pages:
+                    st.dataframe(pd.DataFrame({"url": linked_pages}), use_container_width=True)
                 else:
                     st.info("No pages linked yet.")
 
                 st.write("📝 Notes")
                 notes_df = get_notes(keyword)
                 if not notes_df.empty:
-                    notes_df = notes_df.sort_values("date", ascending=False)
                     latest_note = notes_df.iloc[0]
                     st.markdown(
                         f"""<div style="background-color:#d1fae5; padding:14px; border-radius:8px; margin-bottom:14px;">
@@ -230,14 +400,15 @@ def main():
 
                     if len(notes_df) > 1:
                         st.write("📜 Older Notes")
-                        for _, row in notes_df.iloc[1:].iterrows():
-                            st.markdown(
-                                f"""<div style="background-color:#f9fafb; padding:10px; border-radius:6px; margin-bottom:8px;">
-                                    <b>{row['date']}</b> — <i>{row['keyword']}</i><br>
-                                    <span style="font-size:14px; white-space:pre-wrap;">{row['note']}</span>
-                                </div>""",
-                                unsafe_allow_html=True
-                            )
+                        # Build every older note into one HTML string and render it with a single markdown call
+                        older_html = "".join(
+                            f"""<div style="background-color:#f9fafb; padding:10px; border-radius:6px; margin-bottom:8px;">
+                                    <b>{row.date}</b> — <i>{row.keyword}</i><br>
+                                    <span style="font-size:14px; white-space:pre-wrap;">{row.note}</span>
+                                </div>"""
+                            for row in notes_df.iloc[1:].itertuples(index=False)
+                        )
+                        st.markdown(older_html, unsafe_allow_html=True)
                 else:
                     st.info("No notes yet.")
 
@@ -253,21 +424,21 @@ def main():
     # ----------------------
     with col2:
         st.subheader("🌐 Pages Explorer")
-        if pages_df.empty:
+        if not has_pages:
             st.info("Upload Pages CSV to see pages.")
         else:
             pg_input = st.text_input("Type or paste page URL", "")
             page = pg_input.strip() if pg_input.strip() else None
 
-            if page and page in pages_df["url"].values:
-                history_p = pages_df[pages_df["url"] == page].sort_values("month")
+            history_p = get_history("pages", page) if page else pd.DataFrame()
+            if not history_p.empty:
                 st.write("📈 Performance History")
                 st.dataframe(history_p, use_container_width=True)
 
                 st.write("🔗 Linked Keywords")
                 linked_kws = get_keywords_for_page(page)
-                if not linked_kws.empty:
-                    st.dataframe(linked_kws, use_container_width=True)
+                if linked_kws:
+                    st.dataframe(pd.DataFrame({"keyword": linked_kws}), use_container_width=True)
                 else:
                     st.info("No keywords linked yet.")
 
@@ -277,28 +448,26 @@ def main():
     st.markdown("---")
     st.subheader("🔗 Keyword ↔ Page Mapping")
 
-    if (not queries_df.empty) and (not pages_df.empty):
+    if has_queries and has_pages:
         left_col, right_col = st.columns(2)
 
         with left_col:
             st.write("Link from Keyword → Pages")
             kw_map = st.text_input("Enter Keyword to map", "")
-            pgs_mult = st.multiselect("Select one or more Pages", sorted(pages_df["url"].unique()))
+            pgs_mult = st.multiselect("Select one or more Pages", get_keys("pages"))
             if st.button("Save Mapping from Keyword → Pages"):
                 if kw_map and pgs_mult:
-                    for pg in pgs_mult:
-                        add_mapping(kw_map, pg)
+                    add_mappings([(kw_map, pg) for pg in pgs_mult])
                     st.success(f"Linked '{kw_map}' to {len(pgs_mult)} page(s).")
                     st.rerun()
 
         with right_col:
             st.write("Link from Page → Keywords")
             pg_map = st.text_input("Enter Page URL to map", "")
-            kws_mult = st.multiselect("Select one or more Keywords", sorted(queries_df["keyword"].unique()))
+            kws_mult = st.multiselect("Select one or more Keywords", get_keys("queries"))
             if st.button("Save Mapping from Page → Keywords"):
                 if pg_map and kws_mult:
-                    for kw in kws_mult:
-                        add_mapping(kw, pg_map)
+                    add_mappings([(kw, pg_map) for kw in kws_mult])
                     st.success(f"Linked '{pg_map}' to {len(kws_mult)} keyword(s).")
                     st.rerun()
     else:
@@ -311,52 +480,22 @@ def main():
     st.subheader("📊 Compare Two Months")
 
     compare_mode = st.radio("Compare for:", ["Keyword", "Page"], horizontal=True)
-
-    if compare_mode == "Keyword" and not queries_df.empty:
-        kw_cmp = st.text_input("Enter Keyword for comparison", "")
-        months = sorted(queries_df["month"].dropna().unique())
-        if len(months) >= 2 and kw_cmp:
-            m1 = st.selectbox("First month", months, index=0, key="cmp_kw_m1")
-            m2 = st.selectbox("Second month", months, index=1, key="cmp_kw_m2")
-            if m1 != m2:
-                a = aggregate_metrics(queries_df, "keyword", kw_cmp, m1)
-                b = aggregate_metrics(queries_df, "keyword", kw_cmp, m2)
-                if a and b:
-                    comp = pd.DataFrame({
-                        "Metric": ["Clicks", "Impressions", "CTR", "Position"],
-                        m1: [a["Clicks"], a["Impressions"], a["CTR"], a["Position"]],
-                        m2: [b["Clicks"], b["Impressions"], b["CTR"], b["Position"]],
-                        "Change": [
-                            b["Clicks"] - a["Clicks"],
-                            b["Impressions"] - a["Impressions"],
-                            b["CTR"] - a["CTR"],
-                            b["Position"] - a["Position"],
-                        ]
-                    })
-                    st.dataframe(comp.style.applymap(color_change, subset=["Change"]), use_container_width=True)
-
-    elif compare_mode == "Page" and not pages_df.empty:
-        pg_cmp = st.text_input("Enter Page URL for comparison", "")
-        months_pg = sorted(pages_df["month"].dropna().unique())
-        if len(months_pg) >= 2 and pg_cmp:
-            m1 = st.selectbox("First month", months_pg, index=0, key="cmp_pg_m1")
-            m2 = st.selectbox("Second month", months_pg, index=1, key="cmp_pg_m2")
+    # Both modes run the same flow against a different table
+    cmp_table, cmp_label, cmp_key, cmp_ready = {
+        "Keyword": ("queries", "Enter Keyword for comparison", "cmp_kw", has_queries),
+        "Page": ("pages", "Enter Page URL for comparison", "cmp_pg", has_pages),
+    }[compare_mode]
+
+    if cmp_ready:
+        cmp_value = st.text_input(cmp_label, "")
+        months = get_months(cmp_table)
+        if len(months) >= 2 and cmp_value:
+            m1 = st.selectbox("First month", months, index=0, key=f"{cmp_key}_m1")
+            m2 = st.selectbox("Second month", months, index=1, key=f"{cmp_key}_m2")
             if m1 != m2:
-                a = aggregate_metrics(pages_df, "url", pg_cmp, m1)
-                b = aggregate_metrics(pages_df, "url", pg_cmp, m2)
-                if a and b:
-                    comp = pd.DataFrame({
-                        "Metric": ["Clicks", "Impressions", "CTR", "Position"],
-                        m1: [a["Clicks"], a["Impressions"], a["CTR"], a["Position"]],
-                        m2: [b["Clicks"], b["Impressions"], b["CTR"], b["Position"]],
-                        "Change": [
-                            b["Clicks"] - a["Clicks"],
-                            b["Impressions"] - a["Impressions"],
-                            b["CTR"] - a["CTR"],
-                            b["Position"] - a["Position"],
-                        ]
-                    })
-                    st.dataframe(comp.style.applymap(color_change, subset=["Change"]), use_container_width=True)
+                comp = compare_months(cmp_table, cmp_value, m1, m2)
+                if comp is not None:
+                    st.dataframe(comp.style.apply(style_change, subset=["Change"]), use_container_width=True)
 
 if __name__ == "__main__":
     main()